@@ -6,17 +6,32 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 from __future__ import annotations
 import os
+import asyncio
 import pathlib
+import io
 import json
 import datetime
 import hashlib
+import functools
 import argparse
 import email.utils
 import sys
+import re
 import logging
+import time
 import httpx
 import xml.etree.ElementTree as etree
-from typing import List, Dict, Any, Optional
+from xml.sax.saxutils import escape
+from typing import List, Dict, Any, Optional, Tuple, FrozenSet
+
+try:
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+    json_loads = json.loads
 
 GH_HOST = "https://api.github.com"
 PARENT_DIR = pathlib.Path(__file__).parent
@@ -24,28 +39,69 @@ REQ_CACHE = PARENT_DIR.parent.joinpath("cache/request_cache.json")
 ASSETS_PATH = PARENT_DIR.parent.joinpath("assets")
 CFG_PATH = PARENT_DIR.joinpath("config.json")
 NS_URL = "https://arksine.github.io/moonlight"
+CONFIG_HASH_TAG = f"{{{NS_URL}}}configHash"
+CONTENT_HASH_TAG = f"{{{NS_URL}}}contentHash"
+BASE_HEADERS = {"Accept": "application/vnd.github.v3+json"}
+MAX_ITEMS = 20
+MAX_CONCURRENT_REQS = 8
+RATE_LIMIT_FLOOR = 5
+PRETTY = os.getenv("MOONLIGHT_PRETTY", "1") == "1"
+# Increment when changes to the writer alter the generated feeds
+FEED_FORMAT_VERSION = 1
+FEED_FORMAT = {"version": FEED_FORMAT_VERSION, "pretty": PRETTY}
+EOL = "\n" if PRETTY else ""
+INDENT: Dict[int, str] = {
+    level: "    " * level if PRETTY else "" for level in range(4)
+}
+RSS_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    f'<rss version="2.0" xmlns:moonlight="{NS_URL}">{EOL}'
+    f"{INDENT[1]}<channel>{EOL}"
+).encode()
+RSS_FOOTER = f"{INDENT[1]}</channel>{EOL}</rss>".encode()
+ITEM_START = f"{INDENT[2]}<item>{EOL}".encode()
+ITEM_END = f"{INDENT[2]}</item>{EOL}".encode()
+FEED_HEAD_SIZE = 4096
+CONFIG_HASH_RE = re.compile(
+    rb"<moonlight:configHash>([^<]+)</moonlight:configHash>"
+)
+CONTENT_HASH_RE = re.compile(
+    rb"<moonlight:contentHash>([^<]+)</moonlight:contentHash>"
+)
+PUB_DATE_RE = re.compile(rb"<pubDate>([^<]+)</pubDate>")
+GQL_ISSUES_FIELD = (
+    "issues(labels: [\"announcement\"], states: OPEN, first: 100, "
+    "orderBy: {field: CREATED_AT, direction: DESC}) { nodes { "
+    "number title body url createdAt author { login } "
+    "labels(first: 20) { nodes { name } } } }"
+)
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = (
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"
+)
 
 logging.basicConfig(stream=sys.stderr, level=logging.INFO)
-etree.register_namespace("moonlight", NS_URL)
-
-def RssElement(
-    parent: etree.Element,
-    tag: str,
-    text: Optional[str] = None,
-    level: int = 1,
-    is_last: bool = False
-) -> etree.Element:
-    node = etree.SubElement(parent, tag)
-    if text is not None:
-        node.text = text
-    else:
-        # assume an rss node with no text has children
-        node.text = "\n" + "    " * (level + 1)
-    if is_last:
-        node.tail = "\n" + "    " * (level - 1)
-    else:
-        node.tail = "\n" + "    " * level
-    return node
+
+@functools.lru_cache(maxsize=4096)
+def escape_text(text: str) -> str:
+    return escape(text)
+
+def format_rfc2822(dt: datetime.datetime) -> str:
+    return (
+        f"{WEEKDAYS[dt.weekday()]}, {dt.day:02d} {MONTHS[dt.month - 1]} "
+        f"{dt.year:04d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} GMT"
+    )
+
+@functools.lru_cache(maxsize=1024)
+def convert_gh_date(date: str) -> str:
+    # GitHub dates are always in the form "YYYY-MM-DDTHH:MM:SSZ",
+    # convert to RFC 2822 format
+    dt = datetime.datetime(
+        int(date[0:4]), int(date[5:7]), int(date[8:10]),
+        int(date[11:13]), int(date[14:16]), int(date[17:19])
+    )
+    return format_rfc2822(dt)
 
 class RssDocument:
     def __init__(
@@ -55,145 +111,338 @@ class RssDocument:
     ) -> None:
         self.name = name
         self.repo = f"{options['repo_owner']}/{options['repo_name']}"
-        self.authorized: List[str] = [
+        self.repo_lower = self.repo.lower()
+        self.authorized: FrozenSet[str] = frozenset(
             ac.lower() for ac in options["authorized_creators"]
-        ]
+        )
         self.date = datetime.datetime.now(datetime.timezone.utc)
         self.cfg_hash = cfg_hash
-        self.root = etree.Element("rss", {"version": "2.0", "xmlns:moonlight": NS_URL})
-        self.root.text = "\n    "
-        self.channel = RssElement(self.root, "channel", is_last=True)
-        RssElement(self.channel, "title", self.repo.lower(), level=2)
-        RssElement(self.channel, "link", f"https://github.com/{self.repo}", level=2)
-        RssElement(self.channel, "description", options["description"], level=2)
-        date_str = email.utils.format_datetime(self.date, usegmt=True)
-        RssElement(self.channel, "pubDate", date_str, level=2)
-        RssElement(self.channel, "moonlight:configHash", self.cfg_hash, level=2)
+        date_str = format_rfc2822(self.date)
+        self.channel: List[Tuple[str, str]] = [
+            ("title", self.repo_lower),
+            ("link", f"https://github.com/{self.repo}"),
+            ("description", escape_text(options["description"])),
+            ("pubDate", date_str),
+            ("moonlight:configHash", self.cfg_hash)
+        ]
+        self.items: List[Dict[str, str]] = []
 
     def add_items_from_issues(self, issues: List[Dict[str, Any]]) -> None:
         for issue in issues:
+            if len(self.items) == MAX_ITEMS:
+                break
             user: str = issue["user"]["login"]
             if user.lower() not in self.authorized:
                 continue
-            item = RssElement(self.channel, "item", level=2)
-            RssElement(item, "title", issue["title"], level=3)
-            RssElement(item, "link", issue["html_url"], level=3)
             desc: str = issue["body"].strip()
             desc = desc.split("\r\n\r\n", 1)[0]
             desc = desc.replace("\r\n", " ")
             if len(desc) > 512:
                 desc = desc[:509] + "..."
-            RssElement(item, "description", desc, level=3)
-            # Date is in ISO 8601 with a "Z" appended, convert to
-            # RFC 2822 format
-            date: str = issue["created_at"]
-            date = date[:-1] + "+00:00"
-            dt = datetime.datetime.fromisoformat(date)
-            rfc_date = email.utils.format_datetime(dt, usegmt=True)
-            RssElement(item, "pubDate", rfc_date, level=3)
-            priority = "normal"
+            rfc_date = convert_gh_date(issue["created_at"])
             labels: List[Dict[str, Any]] = issue["labels"]
-            for lbl in labels:
-                if lbl["name"] == "critical":
-                    priority = "high"
-                    break
-            RssElement(item, "category", priority, level=3)
-            guid = f"{self.repo}/issue/{issue['number']}".lower()
-            RssElement(item, "guid", guid, level=3, is_last=True)
-        last = list(self.channel)[-1]
-        last.tail = last.tail[:-4]
-
-    def equals(self, feed_info: Dict[str, Any]) -> bool:
-        other_root: Optional[etree.Element] = feed_info["root"]
-        if other_root is None:
-            return False
-        if self.cfg_hash != feed_info["config_hash"]:
-            return False
-        cur_items = self.root.findall("channel/item")
-        last_items = other_root.findall("channel/item")
-        if len(cur_items) != len(last_items):
-            return False
-        last_uid_map: Dict[str, etree.Element] = {
-            node.findtext("guid", default=""): node for node in last_items
-        }
-        for item in cur_items:
-            guid = item.findtext("guid", default="")
-            if not guid:
-                return False
-            last_item = last_uid_map.get(guid)
-            if last_item is None:
-                return False
-            # Compare tags.  There is no need compare guid as we know they
-            # match if we have reached this point:
-            for tag in ["title", "link", "description", "pubDate", "category"]:
-                if item.findtext(tag, default="") != last_item.findtext(tag):
-                    return False
-        return True
+            if any(lbl["name"] == "critical" for lbl in labels):
+                priority = "high"
+            else:
+                priority = "normal"
+            guid = f"{self.repo_lower}/issue/{issue['number']}"
+            # Text is stored pre-escaped, only the title and
+            # description may contain reserved characters
+            self.items.append({
+                "title": escape_text(issue["title"]),
+                "link": issue["html_url"],
+                "description": escape_text(desc),
+                "pubDate": rfc_date,
+                "category": priority,
+                "guid": guid
+            })
+
+    @functools.cached_property
+    def item_data(self) -> bytes:
+        buf = io.BytesIO()
+        for item in self.items:
+            buf.write(ITEM_START)
+            for tag, text in item.items():
+                buf.write(f"{INDENT[3]}<{tag}>{text}</{tag}>{EOL}".encode())
+            buf.write(ITEM_END)
+        return buf.getvalue()
+
+    @functools.cached_property
+    def content_hash(self) -> str:
+        # The channel pubDate changes with every run, so only the
+        # items are hashed.  All other channel elements are derived
+        # from the configuration and covered by the config hash.
+        return hashlib.sha256(self.item_data).hexdigest()
+
+    def render_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        buf.write(RSS_HEADER)
+        for tag, text in self.channel:
+            buf.write(f"{INDENT[2]}<{tag}>{text}</{tag}>{EOL}".encode())
+        buf.write(
+            f"{INDENT[2]}<moonlight:contentHash>{self.content_hash}"
+            f"</moonlight:contentHash>{EOL}".encode()
+        )
+        buf.write(self.item_data)
+        buf.write(RSS_FOOTER)
+        return buf.getvalue()
 
     def write(self):
-        tree = etree.ElementTree(self.root)
         path = ASSETS_PATH.joinpath(f"{self.name}.xml")
-        tree.write(path, encoding="utf-8", xml_declaration=True)
-
-def hash_config(name: str, options: Dict[str, Any]) -> None:
-    hash = hashlib.sha256()
-    hash.update(name.encode())
-    sorted_opts: Dict[str, Any]
-    sorted_opts = dict(sorted(options.items(), key=lambda x: x[0]))
-    hash.update(json.dumps(sorted_opts).encode())
+        path.write_bytes(self.render_bytes())
+
+def hash_config(name: str, options: Dict[str, Any]) -> str:
+    hash = hashlib.sha256(name.encode())
+    hash.update(json.dumps(options, sort_keys=True).encode())
     return hash.hexdigest()
 
+def find_child(parent: etree.Element, tag: str) -> Optional[etree.Element]:
+    for child in parent:
+        if child.tag == tag:
+            return child
+    return None
+
+def find_child_text(parent: etree.Element, tag: str) -> Optional[str]:
+    child = find_child(parent, tag)
+    if child is None:
+        return None
+    return child.text or ""
+
 def get_feed_info(name: str) -> Dict[str, Any]:
     ret: Dict[str, Any] = {
-        "root": None,
         "config_hash": None,
+        "content_hash": None,
         "last_pub": None
     }
     path = ASSETS_PATH.joinpath(f"{name}.xml")
-    if path.is_file():
-        et = etree.parse(str(path))
-        ret["root"] = et.getroot()
-        cfg_hash = et.findtext("channel/moonlight:configHash",
-                               namespaces={"moonlight": NS_URL})
-        ret["config_hash"] = cfg_hash
-        date = et.findtext("channel/pubDate")
-        if date is not None:
-            try:
-                dt = email.utils.parsedate_to_datetime(date)
-                ret["last_pub"] = dt
-            except Exception:
-                pass
+    if not path.is_file():
+        return ret
+    with path.open("rb") as f:
+        head = f.read(FEED_HEAD_SIZE)
+    date: Optional[str] = None
+    if b"<item>" in head or b"</channel>" in head:
+        # All channel level elements precede the items, so they
+        # can be extracted from the head of the file
+        match = CONFIG_HASH_RE.search(head)
+        if match is not None:
+            ret["config_hash"] = match.group(1).decode()
+        match = CONTENT_HASH_RE.search(head)
+        if match is not None:
+            ret["content_hash"] = match.group(1).decode()
+        match = PUB_DATE_RE.search(head)
+        if match is not None:
+            date = match.group(1).decode()
+    else:
+        # The channel elements don't fit in the head, fall back
+        # to parsing the full document
+        root = etree.parse(str(path)).getroot()
+        channel = find_child(root, "channel")
+        if channel is not None:
+            ret["config_hash"] = find_child_text(channel, CONFIG_HASH_TAG)
+            ret["content_hash"] = find_child_text(channel, CONTENT_HASH_TAG)
+            date = find_child_text(channel, "pubDate")
+    if date is not None:
+        try:
+            dt = email.utils.parsedate_to_datetime(date)
+            ret["last_pub"] = dt
+        except Exception:
+            pass
+    return ret
+
+class RateLimiter:
+    def __init__(self, max_requests: int) -> None:
+        self.sem = asyncio.Semaphore(max_requests)
+        self.throttle_until: float = 0.
+
+    def update(self, resp: httpx.Response) -> None:
+        remaining = resp.headers.get("x-ratelimit-remaining")
+        reset = resp.headers.get("x-ratelimit-reset")
+        if remaining is None or reset is None:
+            return
+        if int(remaining) < RATE_LIMIT_FLOOR:
+            # Throttle subsequent requests until the limit resets
+            self.throttle_until = max(self.throttle_until, float(reset))
+
+    async def wait(self) -> None:
+        delay = self.throttle_until - time.time()
+        if delay > 0:
+            logging.info(
+                f"Rate limit reached, waiting {delay:.0f} seconds for reset"
+            )
+            await asyncio.sleep(delay)
+
+async def gh_request(
+    client: httpx.AsyncClient,
+    limiter: RateLimiter,
+    method: str,
+    url: str,
+    **kwargs: Any
+) -> httpx.Response:
+    async with limiter.sem:
+        await limiter.wait()
+        resp = await client.request(method, url, **kwargs)
+        limiter.update(resp)
+        if (
+            resp.status_code == 403 and
+            resp.headers.get("x-ratelimit-remaining") == "0" and
+            "x-ratelimit-reset" in resp.headers
+        ):
+            await limiter.wait()
+            resp = await client.request(method, url, **kwargs)
+            limiter.update(resp)
+        return resp
+
+async def fetch_issues_rest(
+    client: httpx.AsyncClient,
+    limiter: RateLimiter,
+    repos: Dict[str, Dict[str, Any]],
+    cache: Dict[str, Any]
+) -> Dict[str, Tuple[str, List[Dict[str, Any]]]]:
+    names: List[str] = []
+    requests: List[Tuple[str, Dict[str, str]]] = []
+    for name, options in repos.items():
+        owner = options["repo_owner"]
+        repo = options["repo_name"]
+        qs = "labels=announcement&state=open&per_page=100"
+        url = f"{GH_HOST}/repos/{owner}/{repo}/issues?{qs}"
+        headers: Dict[str, str] = {}
+        etag = cache[name].get("etag")
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        last_modified = cache[name].get("last_modified")
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+        names.append(name)
+        requests.append((url, headers))
+    # query issues for all repos concurrently, requests are
+    # multiplexed over the client's connection
+    responses = await asyncio.gather(
+        *[gh_request(client, limiter, "GET", url, headers=headers)
+          for url, headers in requests],
+        return_exceptions=True
+    )
+    ret: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+    for name, resp in zip(names, responses):
+        if isinstance(resp, Exception):
+            logging.info(f"Error fetching {name}: {resp}")
+            continue
+        if resp.status_code == 304:
+            logging.info(f"Not modified: {name}")
+            continue
+        elif resp.status_code != httpx.codes.OK:
+            logging.info(f"Error fetching {name}")
+            continue
+        if "etag" in resp.headers:
+            cache[name]["etag"] = resp.headers["etag"]
+        if "last-modified" in resp.headers:
+            cache[name]["last_modified"] = resp.headers["last-modified"]
+        resp_hash = hashlib.sha256(resp.content).hexdigest()
+        ret[name] = (resp_hash, json_loads(resp.content))
+    return ret
+
+def convert_gql_issue(node: Dict[str, Any]) -> Dict[str, Any]:
+    # Map GraphQL issue fields to those returned by the REST API.  The
+    # author is null when the user's account has been deleted.
+    author: Dict[str, Any] = node["author"] or {}
+    return {
+        "number": node["number"],
+        "title": node["title"],
+        "body": node["body"],
+        "html_url": node["url"],
+        "created_at": node["createdAt"],
+        "user": {"login": author.get("login", "")},
+        "labels": node["labels"]["nodes"]
+    }
+
+async def fetch_issues_graphql(
+    client: httpx.AsyncClient,
+    limiter: RateLimiter,
+    repos: Dict[str, Dict[str, Any]]
+) -> Dict[str, Tuple[str, List[Dict[str, Any]]]]:
+    if not repos:
+        return {}
+    # Query the issues for all repos in a single request, with an
+    # aliased repository field for each repo
+    names = list(repos.keys())
+    fields: List[str] = []
+    for idx, options in enumerate(repos.values()):
+        owner = json.dumps(options["repo_owner"])
+        repo = json.dumps(options["repo_name"])
+        fields.append(
+            f"repo{idx}: repository(owner: {owner}, name: {repo}) "
+            f"{{ {GQL_ISSUES_FIELD} }}"
+        )
+    query = "query { " + " ".join(fields) + " }"
+    ret: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+    try:
+        resp = await gh_request(
+            client, limiter, "POST", f"{GH_HOST}/graphql",
+            json={"query": query}
+        )
+    except Exception as e:
+        logging.info(f"Error fetching GraphQL query: {e}")
+        return ret
+    if resp.status_code != httpx.codes.OK:
+        logging.info(f"Error fetching GraphQL query: {resp.status_code}")
+        return ret
+    result: Dict[str, Any] = json_loads(resp.content)
+    for err in result.get("errors", []):
+        logging.info(f"GraphQL error: {err.get('message')}")
+    data: Dict[str, Any] = result.get("data") or {}
+    for idx, name in enumerate(names):
+        repo_data: Optional[Dict[str, Any]] = data.get(f"repo{idx}")
+        if repo_data is None:
+            logging.info(f"Error fetching {name}")
+            continue
+        nodes: List[Dict[str, Any]] = repo_data["issues"]["nodes"]
+        # There is no ETag for GraphQL responses, the hash of the
+        # repo's issues is compared with the previous response instead
+        resp_hash = hashlib.sha256(json_dumps(nodes)).hexdigest()
+        ret[name] = (resp_hash, [convert_gql_issue(node) for node in nodes])
     return ret
 
 def read_cache() -> Dict[str, Any]:
     if not REQ_CACHE.is_file():
         return {}
     logging.info("Cache File Found")
-    return json.loads(REQ_CACHE.read_text())
+    return json_loads(REQ_CACHE.read_bytes())
 
 def write_cache(data: Dict[str, Any]) -> None:
     if not REQ_CACHE.parent.exists():
         REQ_CACHE.parent.mkdir()
     logging.info("Writing Cache")
-    REQ_CACHE.write_text(json.dumps(data))
+    REQ_CACHE.write_bytes(json_dumps(data))
 
 def read_config() -> Dict[str, Dict[str, Any]]:
-    with CFG_PATH.open() as f:
-        return json.load(f)
+    return json_loads(CFG_PATH.read_bytes())
 
-def main(token: Optional[str] = None, enable_cache=False) -> None:
+async def main(
+    token: Optional[str] = None,
+    enable_cache: bool = False,
+    use_graphql: bool = False
+) -> None:
     token = token or os.getenv('GITHUB_TOKEN', None)
     if token is not None:
         logging.info("Github Token Detected")
+    elif use_graphql:
+        logging.info("GraphQL requires a token, using the REST API")
+        use_graphql = False
     force = os.getenv("FORCE_UPDATE", "false").lower() == "true"
     if force:
         logging.info("Force Update Enabled")
+    min_refresh = int(os.getenv("MIN_REFRESH_SECONDS", "0"))
+    now = datetime.datetime.now(datetime.timezone.utc)
     cache: Dict[str, Any] = {}
     if enable_cache:
         cache = read_cache()
     new_cache: Dict[str, Any] = {}
+    client_headers = dict(BASE_HEADERS)
+    if token is not None:
+        client_headers["Authorization"] = f"token {token}"
     config = read_config()
     need_commit = False
+    repos: Dict[str, Dict[str, Any]] = {}
+    feed_infos: Dict[str, Dict[str, Any]] = {}
     for name, options in config.items():
         repo_cache = cache.get(name, {})
         new_cache[name] = dict(repo_cache)
@@ -201,35 +450,60 @@ def main(token: Optional[str] = None, enable_cache=False) -> None:
         cfg_hash = hash_config(name, options)
         new_cache[name]["config_hash"] = cfg_hash
         feed_info = get_feed_info(name)
-        # query issues for each repo, creating xml files.  If
-        # a current xml file exists and its contents are the
-        # same, don't modify.
-        owner = options["repo_owner"]
-        repo = options["repo_name"]
-        qs = "labels=announcement&per_page=20"
-        url = f"{GH_HOST}/repos/{owner}/{repo}/issues?{qs}"
-        headers: Dict[str, str] = {"Accept": "application/vnd.github.v3+json"}
-        if token is not None:
-            headers["Authorization"] = f"token {token}"
-        etag = repo_cache.get("etag")
-        if etag is not None:
-            headers["If-None-Match"] = etag
-        with httpx.Client(http2=True) as client:
-            resp = client.get(url, headers=headers, timeout=2.0)
-        if resp.status_code == 304:
-            logging.info(f"Not modified: {name}")
+        last_pub: Optional[datetime.datetime] = feed_info["last_pub"]
+        if (
+            not force and
+            last_pub is not None and
+            feed_info["config_hash"] == cfg_hash and
+            (now - last_pub).total_seconds() < min_refresh
+        ):
+            logging.info(f"Recently updated, skipping: {name}")
             continue
-        elif resp.status_code != httpx.codes.OK:
-            logging.info(f"Error fetching {name}")
+        repos[name] = options
+        feed_infos[name] = feed_info
+    limiter = RateLimiter(MAX_CONCURRENT_REQS)
+    async with httpx.AsyncClient(
+        http2=True, timeout=10.0, headers=client_headers
+    ) as client:
+        if use_graphql:
+            results = await fetch_issues_graphql(client, limiter, repos)
+        else:
+            results = await fetch_issues_rest(
+                client, limiter, repos, new_cache
+            )
+    # create xml files from the issues.  If a current xml file
+    # exists and its contents are the same, don't modify.  Files
+    # are submitted to the default executor immediately, so they
+    # are written while the next feed is built.
+    loop = asyncio.get_running_loop()
+    writes: List[asyncio.Future] = []
+    for name, (resp_hash, issues) in results.items():
+        cfg_hash = new_cache[name]["config_hash"]
+        feed_info = feed_infos[name]
+        new_cache[name]["response_hash"] = resp_hash
+        new_cache[name]["feed_format"] = FEED_FORMAT
+        repo_cache = cache.get(name, {})
+        if (
+            not force and
+            resp_hash == repo_cache.get("response_hash") and
+            FEED_FORMAT == repo_cache.get("feed_format") and
+            feed_info["config_hash"] == cfg_hash and
+            feed_info["content_hash"] is not None
+        ):
+            # The feed was built from an identical response with
+            # the same render settings
+            logging.info(f"Response unchanged: {name}")
             continue
-        if "etag" in resp.headers:
-            new_cache[name]["etag"] = resp.headers["etag"]
-        doc = RssDocument(name, options, cfg_hash)
-        issues: List[Dict[str, Any]] = resp.json()
+        doc = RssDocument(name, repos[name], cfg_hash)
         doc.add_items_from_issues(issues)
-        if not doc.equals(feed_info) or force:
+        if (
+            force or
+            feed_info["config_hash"] != cfg_hash or
+            feed_info["content_hash"] != doc.content_hash
+        ):
             need_commit = True
-            doc.write()
+            writes.append(loop.run_in_executor(None, doc.write))
+    await asyncio.gather(*writes)
     if new_cache != cache and enable_cache:
         write_cache(new_cache)
     if need_commit:
@@ -247,5 +521,9 @@ if __name__ == "__main__":
         "-c", "--cache", action="store_true",
         help="Enable Etag Cache"
     )
+    parser.add_argument(
+        "-g", "--graphql", action="store_true",
+        help="Fetch all repos with a single GraphQL query"
+    )
     args = parser.parse_args()
-    main(args.token, args.cache)
+    asyncio.run(main(args.token, args.cache, args.graphql))